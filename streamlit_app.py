@@ -1,82 +1,419 @@
 import streamlit as st
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from firebase_admin import storage
+from plotly_resampler import FigureResampler
+from plotly_resampler.aggregation import MinMaxLTTB
+import numpy as np
+from numba import njit
 import pandas as pd
 from datetime import datetime
-import json
+import orjson
 from io import BytesIO
+import os
+from concurrent.futures import ThreadPoolExecutor
 import firebase_admin
 from firebase_admin import credentials, firestore
 from firebase_admin.exceptions import FirebaseError
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from google.cloud.exceptions import NotFound
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.caching.storage.local_disk_cache_storage import get_cache_folder_path
 
 st.set_page_config(page_title="Visualization Creator", layout="wide")
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.cloud import storage  # Correct import
+FIREBASE_BUCKET = "file-processing-app.firebasestorage.app"
+DISK_CACHE_MAX_FILES = 256  # Persisted session artifacts kept in Streamlit's disk cache
+HTTP_POOL_SIZE = 16  # Pooled connections to Google APIs shared by all sessions
+RESAMPLE_THRESHOLD = 200_000  # Rows above which line traces are downsampled
+MAX_SHOWN_POINTS = 10_000  # Points per trace sent to the browser once downsampled
+WEBGL_THRESHOLD = 5000  # Rows above which line traces are rendered with WebGL
 
-def initialize_firebase():
-    """Initialize Firebase if not already initialized"""
-    if not firebase_admin._apps:
-        try:
-            # Ensure Firebase secrets are available
-            if "firebase_service_account" not in st.secrets:
-                st.error("❌ Firebase credentials are missing in Streamlit secrets.")
-                return False
-            
-            # Parse credentials from Streamlit secrets
-            service_account = dict(st.secrets["firebase_service_account"])
+@st.cache_resource(show_spinner=False)
+def _firebase_app():
+    """Initialize the Firebase Admin app once per process"""
+    if "firebase_service_account" not in st.secrets:
+        raise RuntimeError("Firebase credentials are missing in Streamlit secrets.")
 
-            # Initialize Firebase Admin SDK
-            cred = credentials.Certificate(service_account)
-            firebase_admin.initialize_app(cred)
-
-            # Initialize Firestore
-            st.session_state.db = firestore.client()
-            #st.info("✅ Firestore client initialized.")
-
-            # ✅ Correct way to initialize Google Cloud Storage
-            storage_client = storage.Client.from_service_account_info(service_account)  
-            bucket_name = "file-processing-app.firebasestorage.app"  # Ensure bucket name is correct
-            st.session_state.storage_bucket = storage_client.bucket(bucket_name)
+    cred = credentials.Certificate(dict(st.secrets["firebase_service_account"]))
+    try:
+        return firebase_admin.initialize_app(cred, {"storageBucket": FIREBASE_BUCKET})
+    except ValueError:
+        # The default app already exists, e.g. after the resource cache was cleared
+        return firebase_admin.get_app()
+
+@st.cache_resource(show_spinner=False)
+def _db():
+    """Firestore client shared across sessions"""
+    _firebase_app()
+    return firestore.client()
+
+@st.cache_resource(show_spinner=False)
+def _http_session():
+    """Authorized HTTP session whose connection pool is shared by all downloads"""
+    session = AuthorizedSession(_firebase_app().credential.get_credential())
+    # Keep TCP/TLS connections alive across sessions and concurrent downloads
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource(show_spinner=False)
+def _bucket():
+    """Storage bucket shared across sessions"""
+    app = _firebase_app()
+    client = storage.Client(
+        project=app.project_id,
+        credentials=app.credential.get_credential(),
+        _http=_http_session()
+    )
+    return client.bucket(FIREBASE_BUCKET)
+
+@st.cache_resource(show_spinner=False)
+def _download_executor():
+    """Thread pool for concurrent blob downloads, shared across sessions"""
+    return ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE, thread_name_prefix="firebase-download")
 
-            st.success(f"✅ Firebase Storage initialized with bucket: {st.session_state.storage_bucket.name}")
-            return True
+def get_firestore_client():
+    """Get the shared Firestore client"""
+    return _db()
 
-        except Exception as e:
-            st.error(f"🔥 Firebase initialization failed: {e}")
-            return False
+def get_storage_bucket():
+    """Get the shared Firebase Storage bucket"""
+    return _bucket()
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _download_blob(blob_path, generation):
+    """Download the given generation of a blob, once for every parse of it"""
+    # Pin the download to the generation in the cache key so a concurrent
+    # re-upload can't cache new bytes under the old key
+    return get_storage_bucket().blob(blob_path, generation=generation).download_as_bytes()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _fetch_dataframe(blob_path, sheet_name, generation, columns=None):
+    """Download and parse a data blob, cached per blob generation and column set"""
+    return _parse_dataframe(blob_path, sheet_name, generation, columns)
+
+def _prune_disk_cache(max_files=DISK_CACHE_MAX_FILES):
+    """Delete the oldest persisted cache entries beyond max_files"""
+    # Streamlit never deletes disk cache entries itself (max_entries only
+    # bounds the in-memory layer), so persisted caches prune before writing
+    try:
+        with os.scandir(get_cache_folder_path()) as entries:
+            files = [entry for entry in entries if entry.name.endswith(".memo")]
+    except FileNotFoundError:
+        return
 
-    # Ensure storage bucket is set even if Firebase is already initialized
-    if 'storage_bucket' not in st.session_state:
+    if len(files) < max_files:
+        return
+    files.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:len(files) - max_files + 1]:
         try:
-            storage_client = storage.Client.from_service_account_info(st.secrets["firebase_service_account"])
-            st.session_state.storage_bucket = storage_client.bucket("file-processing-app.firebasestorage.app")
-        except Exception as e:
-            st.error(f"🔥 Error initializing Firebase Storage: {e}")
-            return False
-
-    return True
-
+            os.remove(entry.path)
+        except OSError:
+            # Already removed by a concurrent prune
+            pass
+
+@st.cache_data(show_spinner=False, max_entries=128, persist="disk")
+def _fetch_session_dataframe(blob_path, generation):
+    """Download and parse an immutable session data blob, persisted across restarts"""
+    # Only session artifacts are persisted: user files would leave a pickle
+    # per generation and column set
+    _prune_disk_cache()
+    return _parse_dataframe(blob_path, None, generation)
+
+def _parse_dataframe(blob_path, sheet_name, generation, columns=None):
+    """Download and parse a data blob into a compact DataFrame"""
+    data = _download_blob(blob_path, generation)
+    # Only materialize the requested columns (in file order)
+    usecols = None
+
+    if blob_path.endswith('.csv'):
+        if columns is not None:
+            usecols = list(columns)
+        df = _read_csv(data, usecols)
+    elif blob_path.endswith(('.xlsx', '.xls')):
+        if columns is not None:
+            # Excel headers can be numbers (e.g. years), which a usecols list
+            # would mix with strings or read as positions; match by name instead
+            usecols = lambda col: col in columns
+        # sheet_name=None would return every sheet as a dict; default to the first
+        df = _read_excel(data, sheet_name if sheet_name is not None else 0, usecols)
+    else:
+        raise ValueError("Unsupported file format")
+
+    df = _compact_dtypes(df)
+    # Identifies this exact data for downstream caches (e.g. built figures)
+    df.attrs["source"] = (blob_path, sheet_name, generation, columns)
+    return df
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _fetch_columns(blob_path, sheet_name, generation):
+    """Column names of a data blob, read from its header row only"""
+    data = _download_blob(blob_path, generation)
+
+    if blob_path.endswith('.csv'):
+        return pd.read_csv(BytesIO(data), nrows=0).columns.tolist()
+    elif blob_path.endswith(('.xlsx', '.xls')):
+        sheet_name = sheet_name if sheet_name is not None else 0
+        return _read_excel(data, sheet_name, nrows=0).columns.tolist()
+    else:
+        raise ValueError("Unsupported file format")
+
+def _read_csv(data, usecols=None):
+    """Parse CSV bytes with the multi-threaded pyarrow engine"""
+    try:
+        return pd.read_csv(BytesIO(data), engine='pyarrow', usecols=usecols)
+    except Exception:
+        # The pyarrow engine is stricter; let the default engine handle odd files
+        return pd.read_csv(BytesIO(data), usecols=usecols)
 
+def _read_excel(data, sheet_name, usecols=None, nrows=None):
+    """Parse Excel bytes with the calamine engine"""
+    try:
+        return pd.read_excel(BytesIO(data), sheet_name=sheet_name, engine='calamine',
+                             usecols=usecols, nrows=nrows)
+    except Exception:
+        return pd.read_excel(BytesIO(data), sheet_name=sheet_name, usecols=usecols, nrows=nrows)
+
+def _compact_dtypes(df, max_unique_ratio=0.5):
+    """Shrink column dtypes: low-cardinality strings to category, integers to int16 or wider"""
+    if df.empty:
+        return df
+
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if df[col].nunique(dropna=False) / len(df) < max_unique_ratio:
+            df[col] = df[col].astype('category')
+    # Floats are left alone; float32 would change the values shown in hovers
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+        # Stop at int16: plotly-resampler rejects 8-bit x data
+        if df[col].dtype.itemsize < 2:
+            df[col] = df[col].astype(np.int16)
+    return df
+
+def _blob_generation(bucket, blob_path):
+    """Current generation of a blob, used to invalidate cached reads"""
+    blob = bucket.blob(blob_path)
+    blob.reload()
+    return blob.generation
+
+def load_blob_dataframe(bucket, blob_path, sheet_name=None, columns=None):
+    """Load a data blob as a DataFrame, re-downloading only when it changes"""
+    if columns is not None:
+        columns = frozenset(columns)
+    return _fetch_dataframe(blob_path, sheet_name, _blob_generation(bucket, blob_path), columns)
+
+def load_session_dataframe(bucket, session_id):
+    """Load a session's data.csv, re-downloading only when it changes"""
+    blob_path = f"streamlit_sessions/{session_id}/data.csv"
+    return _fetch_session_dataframe(blob_path, _blob_generation(bucket, blob_path))
+
+def load_blob_columns(bucket, blob_path, sheet_name=None):
+    """Load the column names of a data blob without parsing its rows"""
+    return _fetch_columns(blob_path, sheet_name, _blob_generation(bucket, blob_path))
+
+@st.cache_data(show_spinner=False, max_entries=128, persist="disk")
+def _fetch_session_config(blob_path, generation):
+    """Download and parse a session's config.json, cached per blob generation"""
+    _prune_disk_cache()
+    blob = get_storage_bucket().blob(blob_path, generation=generation)
+    return orjson.loads(blob.download_as_bytes())
+
+def load_session_config(session_id):
+    """Load a session's config.json, or None if it doesn't exist"""
+    blob_path = f"streamlit_sessions/{session_id}/config.json"
+    try:
+        # Exceptions aren't cached, so a config written later is still picked up
+        return _fetch_session_config(blob_path, _blob_generation(get_storage_bucket(), blob_path))
+    except NotFound:
+        return None
+
+@njit(cache=True)
+def _group_sum(codes, values, n_groups):
+    """Sum values per category code, skipping missing labels and values"""
+    totals = np.zeros(n_groups, dtype=np.float64)
+    seen = np.zeros(n_groups, dtype=np.bool_)
+    for i in range(codes.shape[0]):
+        code = codes[i]
+        if code < 0:
+            continue
+        seen[code] = True
+        if not np.isnan(values[i]):
+            totals[code] += values[i]
+    return totals, seen
+
+def _categorical_group_sum(labels, values):
+    """Equivalent of groupby(observed=True).sum() for a categorical label column"""
+    categories = labels.cat.categories
+    totals, seen = _group_sum(
+        labels.cat.codes.to_numpy(),
+        values.to_numpy(dtype=np.float64, na_value=np.nan),
+        len(categories)
+    )
+    return categories.to_numpy()[seen], totals[seen]
+
+def _axis_values(column):
+    """Values for a shared category axis, plus the axis type they need (if any)"""
+    if pd.api.types.is_datetime64_dtype(column.dtype):
+        # Plotly serializes datetimes as one ISO string per point and repeats
+        # them in every trace; float epoch milliseconds on a date axis go out
+        # as a compact binary array instead
+        values = column.to_numpy(dtype='datetime64[ms]').astype(np.int64).astype(np.float64)
+        values[column.isna().to_numpy()] = np.nan
+        return values, 'date'
+    return column.to_numpy(), None
+
+def _resamples(df, x_axis, series_list):
+    """Whether the line / bar figure downsamples its line series"""
+    # The figure goes out as a static dict, so zooming in shows the same
+    # overview rather than re-aggregating the visible range; only resample
+    # where full resolution would be too much for the browser
+    x_dtype = df[x_axis].dtype
+    # Only the x dtypes plotly-resampler accepts: 16+ bit integers, 32+ bit
+    # floats and datetimes (not bool, 8-bit ints, float16 or extension dtypes)
+    resamplable_x = pd.api.types.is_datetime64_dtype(x_dtype) or (
+        isinstance(x_dtype, np.dtype)
+        and x_dtype.kind in "iuf"
+        and x_dtype.itemsize >= (4 if x_dtype.kind == "f" else 2)
+    )
+    return (
+        len(df) > RESAMPLE_THRESHOLD
+        and any(series["type"] == "Line" for series in series_list)
+        and resamplable_x
+        and df[x_axis].is_monotonic_increasing
+    )
+
+def _build_line_bar_figure(df, x_axis, series_list, title, bar_type):
+    """Build the line / vertical bar figure for the given series"""
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    # Line series too long even for WebGL are downsampled before being sent
+    # to the browser. plotly-resampler only handles scatter traces, so bars
+    # are always sent at full resolution.
+    resample = _resamples(df, x_axis, series_list)
+    if resample:
+        fig = FigureResampler(
+            fig,
+            default_n_shown_samples=MAX_SHOWN_POINTS,
+            resampled_trace_prefix_suffix=("", ""),
+            show_mean_aggregation_size=False
+        )
+    
+    # Large line series are drawn with WebGL instead of SVG. Browsers only
+    # allow 8-16 WebGL contexts per page, so every trace shares the single
+    # subplot of this preview (and therefore a single context).
+    scatter = go.Scattergl if len(df) > WEBGL_THRESHOLD else go.Scatter
+
+    # Hand Plotly plain ndarrays so it skips its per-trace Series conversion
+    x_values, x_type = _axis_values(df[x_axis])
+
+    traces, secondary_ys, downsamplers = [], [], []
+    for series in series_list:
+        y_values = df[series["column"]].to_numpy()
+        if series["type"] == "Line":
+            traces.append(scatter(
+                x=x_values,
+                y=y_values,
+                name=series["column"],
+                line=dict(color=series["color"])
+            ))
+            downsamplers.append(MinMaxLTTB())
+        else:
+            traces.append(go.Bar(
+                x=x_values,
+                y=y_values,
+                name=series["column"],
+                marker_color=series["color"]
+            ))
+            downsamplers.append(None)
+        secondary_ys.append(series["axis"] == "Right")
+
+    # Add every trace in one call so Plotly validates the batch once
+    if resample:
+        fig.add_traces(traces, secondary_ys=secondary_ys, downsamplers=downsamplers)
+    else:
+        fig.add_traces(traces, secondary_ys=secondary_ys)
+
+    # A single layout update; uirevision keeps zoom/pan state across reruns
+    layout = dict(
+        title=title,
+        barmode='stack' if bar_type == "Stacked Bars" else 'group',
+        uirevision='constant'
+    )
+    if x_type:
+        layout["xaxis_type"] = x_type
+    fig.update_layout(**layout)
+    return fig
+
+def _build_horizontal_bar_figure(df, x_axis, series_list, title, bar_type):
+    """Build the horizontal bar figure for the given series"""
+    fig = go.Figure()
+    y_values, y_type = _axis_values(df[x_axis])
+    
+    fig.add_traces([
+        go.Bar(
+            y=y_values,
+            x=df[series["column"]].to_numpy(),
+            name=series["column"],
+            marker_color=series["color"],
+            orientation='h'
+        )
+        for series in series_list
+    ])
+
+    # A single layout update; uirevision keeps zoom/pan state across reruns
+    layout = dict(
+        title=title,
+        barmode='stack' if bar_type == "Stacked Bars" else 'group',
+        uirevision='constant'
+    )
+    if y_type:
+        layout["yaxis_type"] = y_type
+    fig.update_layout(**layout)
+    return fig
+
+def _build_pie_donut_figure(df, labels, values, title, chart_type, largest_items):
+    """Build the pie / donut figure of values summed per label"""
+    if isinstance(df[labels].dtype, pd.CategoricalDtype) and pd.api.types.is_numeric_dtype(df[values]):
+        keys, totals = _categorical_group_sum(df[labels], df[values])
+    else:
+        grouped = df.groupby(labels, sort=False, observed=True)[values].sum()
+        keys = grouped.index.to_numpy()
+        totals = grouped.to_numpy()
+    
+    if largest_items and len(totals):
+        # Partial selection of the top k groups; only those k get sorted
+        k = min(int(largest_items), len(totals))
+        idx = np.argpartition(-totals, k - 1)[:k]
+        idx = idx[np.argsort(-totals[idx], kind='stable')]
+        keys, totals = keys[idx], totals[idx]
+        
+    fig = go.Figure(data=[
+        go.Pie(
+            labels=keys,
+            values=totals,
+            hole=0.4 if chart_type == "Donut" else 0
+        )
+    ])
+    
+    fig.update_layout(title=title)
+    return fig
 
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_figure(build_name, data_key, args, _build, _df):
+    """Figure dict, cached per builder, loaded data and chart config"""
+    # _build and _df are excluded from hashing; build_name and data_key identify them
+    return _build(_df, *args).to_dict()
 
-def get_firestore_client():
-    """Get Firestore client from session state"""
-    if 'db' not in st.session_state:
-        initialize_firebase()
-    return st.session_state.db
+def plot_figure(build, df, *args):
+    """Build a chart with the given builder and draw it, reusing cached figures"""
+    data_key = df.attrs.get("source")
 
-def get_storage_bucket():
-    """Ensure Firebase is initialized before accessing storage bucket"""
-    if 'storage_bucket' not in st.session_state or st.session_state.storage_bucket is None:
-        st.warning("Storage bucket is missing. Reinitializing Firebase...")
-        if not initialize_firebase():  # Try to reinitialize Firebase
-            st.error("Firebase initialization failed. Cannot get storage bucket.")
-            return None  # Prevent further errors
-    
-    return st.session_state.storage_bucket
+    if data_key is None:
+        fig = build(df, *args)
+    else:
+        fig = go.Figure(_cached_figure(build.__name__, data_key, args, build, df))
+    st.plotly_chart(fig, use_container_width=True)
 
 class VisualizationSession:
     def __init__(self, user_email):
@@ -94,22 +431,25 @@ class VisualizationSession:
         if 'selected_columns' not in st.session_state:
             st.session_state.selected_columns = {}
             
-    def load_data(self, file_name, sheet_name=None):
-        """Load data from Firebase Storage"""
+    def load_data(self, file_name, sheet_name=None, columns=None):
+        """Load data from Firebase Storage, optionally only the given columns"""
         bucket = get_storage_bucket()
         blob_path = f"users/{self.user_email}/data/{file_name}"
-        blob = bucket.blob(blob_path)
-        
-        # Download to temporary file
-        local_path = f"/tmp/{file_name}"
-        blob.download_to_filename(local_path)
-        
-        if file_name.endswith('.csv'):
-            return pd.read_csv(local_path)
-        elif file_name.endswith(('.xlsx', '.xls')):
-            return pd.read_excel(local_path, sheet_name=sheet_name)
-        else:
-            raise ValueError("Unsupported file format")
+        return load_blob_dataframe(bucket, blob_path, sheet_name, columns)
+
+    def add_file(self, file_name, sheet_name=None):
+        """Make a file selectable in the interface, reading only its header"""
+        bucket = get_storage_bucket()
+        blob_path = f"users/{self.user_email}/data/{file_name}"
+        st.session_state.selected_columns[file_name] = {
+            "columns": load_blob_columns(bucket, blob_path, sheet_name),
+            "sheet_name": sheet_name
+        }
+
+    def load_selected_data(self, selected_file, columns):
+        """Load just the columns a chart needs from a selected file"""
+        sheet_name = st.session_state.selected_columns[selected_file].get("sheet_name")
+        return self.load_data(selected_file, sheet_name, [col for col in columns if col])
 
     def save_visualization(self, config):
         """Save visualization config to Firebase"""
@@ -119,12 +459,12 @@ class VisualizationSession:
         blob = bucket.blob(blob_path)
         
         blob.upload_from_string(
-            json.dumps(config),
+            orjson.dumps(config),
             content_type='application/json'
         )
         return blob_path
 
-    def render_visualization_interface(self, df):
+    def render_visualization_interface(self):
         """Render the visualization interface"""
         st.header("Visualization")
 
@@ -146,45 +486,58 @@ class VisualizationSession:
         )
 
         if visualization_type == "Line / Vertical Bars / Stacked Vertical Bars / Combination":
-            self.render_line_bar_interface(df, selected_file)
+            self.render_line_bar_interface(selected_file)
         elif visualization_type == "Horizontal Bars / Stacked Horizontal Bars":
-            self.render_horizontal_bar_interface(df, selected_file)
+            self.render_horizontal_bar_interface(selected_file)
         elif visualization_type == "Donut / Pie":
-            self.render_pie_donut_interface(df, selected_file)
+            self.render_pie_donut_interface(selected_file)
 
-    def render_line_bar_interface(self, df, selected_file):
+    def render_line_bar_interface(self, selected_file):
         st.subheader("Line / Vertical Bars / Stacked Vertical Bars / Combination")
+        columns = st.session_state.selected_columns[selected_file]["columns"]
+
+        # Widgets inside the form only trigger a rerun when it is submitted
+        with st.form("line_bar_form"):
+            # Chart Title
+            chart_title = st.text_input("Enter Chart Title")
+
+            # X Axis Selection
+            x_axis = st.selectbox("Select X Axis", columns)
+
+            # Display existing series
+            for idx, series in enumerate(st.session_state.line_bar_series):
+                col1, col2, col3, col4 = st.columns([2, 2, 2, 2])
+                series["column"] = col1.selectbox(
+                    f"Series {idx + 1}",
+                    columns,
+                    key=f"line_bar_series_column_{idx}"
+                )
+                series["type"] = col2.selectbox(
+                    "Visualization Type",
+                    ["Line", "Bar"],
+                    key=f"line_bar_series_type_{idx}"
+                )
+                series["axis"] = col3.selectbox(
+                    "Axis",
+                    ["Left", "Right"],
+                    key=f"line_bar_series_axis_{idx}"
+                )
+                series["color"] = col4.text_input(
+                    "Colour (Hex Code)",
+                    key=f"line_bar_series_color_{idx}"
+                )
 
-        # Chart Title
-        chart_title = st.text_input("Enter Chart Title")
-
-        # X Axis Selection
-        x_axis = st.selectbox("Select X Axis", st.session_state.selected_columns[selected_file]["columns"])
+            # Bar Type Selection
+            bar_type = None
+            if any(series["type"] == "Bar" for series in st.session_state.line_bar_series):
+                bar_type = st.radio(
+                    "Bar Type",
+                    ["Stacked Bars", "Side-by-Side Bars"]
+                )
 
-        # Display existing series
-        for idx, series in enumerate(st.session_state.line_bar_series):
-            col1, col2, col3, col4 = st.columns([2, 2, 2, 2])
-            series["column"] = col1.selectbox(
-                f"Series {idx + 1}",
-                st.session_state.selected_columns[selected_file]["columns"],
-                key=f"line_bar_series_column_{idx}"
-            )
-            series["type"] = col2.selectbox(
-                "Visualization Type",
-                ["Line", "Bar"],
-                key=f"line_bar_series_type_{idx}"
-            )
-            series["axis"] = col3.selectbox(
-                "Axis",
-                ["Left", "Right"],
-                key=f"line_bar_series_axis_{idx}"
-            )
-            series["color"] = col4.text_input(
-                "Colour (Hex Code)",
-                key=f"line_bar_series_color_{idx}"
-            )
+            st.form_submit_button("Update Chart")
 
-        # Add Series Button
+        # Add Series Button (buttons aren't allowed inside a form)
         if st.button("Add Series", key="add_line_bar"):
             st.session_state.line_bar_series.append({
                 "column": None,
@@ -193,159 +546,137 @@ class VisualizationSession:
                 "color": "#000000"
             })
 
-        # Bar Type Selection
-        bar_type = None
-        if any(series["type"] == "Bar" for series in st.session_state.line_bar_series):
-            bar_type = st.radio(
-                "Bar Type",
-                ["Stacked Bars", "Side-by-Side Bars"]
-            )
-
-        # Preview Chart
+        # Preview Chart (form widgets hold their last submitted values between reruns)
         if st.session_state.line_bar_series:
+            df = self.load_selected_data(
+                selected_file, [x_axis] + [series["column"] for series in st.session_state.line_bar_series]
+            )
             self.preview_line_bar_chart(df, x_axis, chart_title, bar_type)
 
-    def render_horizontal_bar_interface(self, df, selected_file):
+    def render_horizontal_bar_interface(self, selected_file):
         st.subheader("Horizontal Bars / Stacked Horizontal Bars")
+        columns = st.session_state.selected_columns[selected_file]["columns"]
+
+        # Widgets inside the form only trigger a rerun when it is submitted
+        with st.form("horizontal_bar_form"):
+            # Chart Title
+            chart_title = st.text_input("Enter Chart Title")
+
+            # X Axis Selection
+            x_axis = st.selectbox("Select X Axis", columns)
+
+            # Display existing series
+            for idx, series in enumerate(st.session_state.horizontal_bar_series):
+                col1, col2 = st.columns([2, 2])
+                series["column"] = col1.selectbox(
+                    f"Series {idx + 1}",
+                    columns,
+                    key=f"horizontal_bar_series_column_{idx}"
+                )
+                series["color"] = col2.text_input(
+                    "Colour (Hex Code)",
+                    key=f"horizontal_bar_series_color_{idx}"
+                )
 
-        # Chart Title
-        chart_title = st.text_input("Enter Chart Title")
+            # Bar Type Selection
+            bar_type = None
+            if len(st.session_state.horizontal_bar_series) > 1:
+                bar_type = st.radio(
+                    "Bar Type",
+                    ["Stacked Bars", "Side-by-Side Bars"]
+                )
 
-        # X Axis Selection
-        x_axis = st.selectbox("Select X Axis", st.session_state.selected_columns[selected_file]["columns"])
+            st.form_submit_button("Update Chart")
 
-        # Display existing series
-        for idx, series in enumerate(st.session_state.horizontal_bar_series):
-            col1, col2 = st.columns([2, 2])
-            series["column"] = col1.selectbox(
-                f"Series {idx + 1}",
-                st.session_state.selected_columns[selected_file]["columns"],
-                key=f"horizontal_bar_series_column_{idx}"
-            )
-            series["color"] = col2.text_input(
-                "Colour (Hex Code)",
-                key=f"horizontal_bar_series_color_{idx}"
-            )
-
-        # Add Series Button
+        # Add Series Button (buttons aren't allowed inside a form)
         if st.button("Add Series", key="add_horizontal_bar"):
             st.session_state.horizontal_bar_series.append({
                 "column": None,
                 "color": "#000000"
             })
 
-        # Bar Type Selection
-        bar_type = None
-        if len(st.session_state.horizontal_bar_series) > 1:
-            bar_type = st.radio(
-                "Bar Type",
-                ["Stacked Bars", "Side-by-Side Bars"]
-            )
-
-        # Preview Chart
+        # Preview Chart (form widgets hold their last submitted values between reruns)
         if st.session_state.horizontal_bar_series:
+            df = self.load_selected_data(
+                selected_file, [x_axis] + [series["column"] for series in st.session_state.horizontal_bar_series]
+            )
             self.preview_horizontal_bar_chart(df, x_axis, chart_title, bar_type)
 
-    def render_pie_donut_interface(self, df, selected_file):
+    def render_pie_donut_interface(self, selected_file):
         st.subheader("Donut / Pie")
+        columns = st.session_state.selected_columns[selected_file]["columns"]
 
-        # Chart Type
-        chart_type = st.radio("Select Chart Type", ["Donut", "Pie"])
+        # Widgets inside the form only trigger a rerun when it is submitted
+        with st.form("pie_donut_form"):
+            # Chart Type
+            chart_type = st.radio("Select Chart Type", ["Donut", "Pie"])
 
-        # Chart Title
-        chart_title = st.text_input("Enter Chart Title")
+            # Chart Title
+            chart_title = st.text_input("Enter Chart Title")
 
-        # Labels and Values
-        labels = st.selectbox("Select Labels", st.session_state.selected_columns[selected_file]["columns"])
-        values = st.selectbox(
-            "Select Values",
-            [col for col in st.session_state.selected_columns[selected_file]["columns"] if col != labels]
-        )
+            # Labels and Values
+            labels = st.selectbox("Select Labels", columns)
+            values = st.selectbox(
+                "Select Values",
+                [col for col in columns if col != labels]
+            )
 
-        # Number of Largest Items
-        largest_items = st.number_input(
-            "Enter number of largest items to show (Optional)",
-            min_value=1,
-            step=1
-        )
+            # Number of Largest Items
+            largest_items = st.number_input(
+                "Enter number of largest items to show (Optional)",
+                min_value=1,
+                step=1
+            )
 
-        # Colour Theme
-        colour_theme = st.selectbox(
-            "Select Colour Theme",
-            ["Blue-Grey", "Yellow-Green", "Red-Orange"]
-        )
+            # Colour Theme
+            colour_theme = st.selectbox(
+                "Select Colour Theme",
+                ["Blue-Grey", "Yellow-Green", "Red-Orange"]
+            )
+
+            st.form_submit_button("Update Chart")
 
         # Preview Chart
         if labels and values:
+            df = self.load_selected_data(selected_file, [labels, values])
             self.preview_pie_donut_chart(df, labels, values, chart_title, chart_type, largest_items, colour_theme)
 
     def preview_line_bar_chart(self, df, x_axis, title, bar_type):
-        fig = make_subplots(specs=[[{"secondary_y": True}]])
-        
-        for series in st.session_state.line_bar_series:
-            if series["type"] == "Line":
-                fig.add_trace(
-                    go.Scatter(
-                        x=df[x_axis],
-                        y=df[series["column"]],
-                        name=series["column"],
-                        line=dict(color=series["color"])
-                    ),
-                    secondary_y=(series["axis"] == "Right")
-                )
-            else:
-                fig.add_trace(
-                    go.Bar(
-                        x=df[x_axis],
-                        y=df[series["column"]],
-                        name=series["column"],
-                        marker_color=series["color"]
-                    ),
-                    secondary_y=(series["axis"] == "Right")
-                )
+        if df.empty or not x_axis or x_axis not in df.columns:
+            return
 
-        if bar_type == "Stacked Bars":
-            fig.update_layout(barmode='stack')
-        
-        fig.update_layout(title=title)
-        st.plotly_chart(fig, use_container_width=True)
+        # Newly added series have no column yet; leave them out of the chart
+        series_list = [
+            series for series in st.session_state.line_bar_series
+            if series.get("column") and series["column"] in df.columns
+        ]
+        if not series_list:
+            return
+
+        plot_figure(_build_line_bar_figure, df, x_axis, series_list, title, bar_type)
+        if _resamples(df, x_axis, series_list):
+            st.caption(f"Line series are downsampled to {MAX_SHOWN_POINTS:,} points; "
+                       "zooming in does not reveal further detail.")
 
     def preview_horizontal_bar_chart(self, df, x_axis, title, bar_type):
-        fig = go.Figure()
-        
-        for series in st.session_state.horizontal_bar_series:
-            fig.add_trace(
-                go.Bar(
-                    y=df[x_axis],
-                    x=df[series["column"]],
-                    name=series["column"],
-                    marker_color=series["color"],
-                    orientation='h'
-                )
-            )
+        if df.empty or not x_axis or x_axis not in df.columns:
+            return
 
-        if bar_type == "Stacked Bars":
-            fig.update_layout(barmode='stack')
-        
-        fig.update_layout(title=title)
-        st.plotly_chart(fig, use_container_width=True)
+        # Newly added series have no column yet; leave them out of the chart
+        series_list = [
+            series for series in st.session_state.horizontal_bar_series
+            if series.get("column") and series["column"] in df.columns
+        ]
+        if not series_list:
+            return
+
+        plot_figure(_build_horizontal_bar_figure, df, x_axis, series_list, title, bar_type)
 
     def preview_pie_donut_chart(self, df, labels, values, title, chart_type, largest_items, colour_theme):
-        df_grouped = df.groupby(labels)[values].sum().reset_index()
-        
-        if largest_items:
-            df_grouped = df_grouped.nlargest(largest_items, values)
-            
-        fig = go.Figure(data=[
-            go.Pie(
-                labels=df_grouped[labels],
-                values=df_grouped[values],
-                hole=0.4 if chart_type == "Donut" else 0
-            )
-        ])
-        
-        fig.update_layout(title=title)
-        st.plotly_chart(fig, use_container_width=True)
+        if df.empty or labels is None or values is None or labels == values:
+            return
+
+        plot_figure(_build_pie_donut_figure, df, labels, values, title, chart_type, largest_items)
 
     def render_preview(self, df, config):
         """Render just the visualization based on config"""
@@ -393,9 +724,8 @@ def main():
     # Set page config as the first command
     # Get parameters from URL
     # Ensure Firebase is initialized when the app starts
-    query_params = st.query_params
-    session_id = query_params.get("session_id", [None])
-    mode = query_params.get("mode", ["full"])  # 'preview' or 'full'
+    session_id = st.query_params.get("session_id")
+    mode = st.query_params.get("mode", "full")  # 'preview' or 'full'
 
     if not session_id:
         st.error("No session ID provided")
@@ -405,36 +735,35 @@ def main():
         # Load session data from Firebase
         bucket = get_storage_bucket()
 
-        #st.info(f"Using bucket: {bucket.name}")
-        #st.info(f"session : {session_id}")
-        config_blob = bucket.blob(f"streamlit_sessions/{session_id}/config.json")
+        if mode == "preview":
+            # The preview data sits next to the config, so fetch both concurrently
+            executor = _download_executor()
+            config_future = executor.submit(load_session_config, session_id)
+            data_future = executor.submit(load_session_dataframe, bucket, session_id)
+            session_data = config_future.result()
+        else:
+            session_data = load_session_config(session_id)
 
-        if not config_blob.exists():
+        if session_data is None:
             st.error(f"Config file not found: streamlit_sessions/{session_id}/config.json")
             return
         
-        session_data = json.loads(config_blob.download_as_string())
-        
-        # Load data
-        if mode == "preview":
-            # For preview, load data directly from session storage
-            data_blob = bucket.blob(f"streamlit_sessions/{session_id}/data.csv")
-            df = pd.read_csv(BytesIO(data_blob.download_as_bytes()))
-        else:
-            # For full mode, load from original file
-            df = load_data_from_firebase(bucket, session_data["email"], 
-                                       session_data["fileName"], 
-                                       session_data.get("sheetName"))
-
         # Initialize visualization session
         viz_session = VisualizationSession(session_data["email"])
         
         if mode == "preview":
+            # For preview, load data directly from session storage
+            df = data_future.result()
+
             # For preview, just render the visualization based on config
             viz_session.render_preview(df, session_data["visualizationConfig"])
         else:
+            # For full mode, read only the header of the original file; the
+            # interface then loads just the columns each chart uses
+            viz_session.add_file(session_data["fileName"], session_data.get("sheetName"))
+
             # For full mode, render the full interface
-            viz_session.render_visualization_interface(df)
+            viz_session.render_visualization_interface()
             
             # Save and Create New buttons (only in full mode)
             col1, col2 = st.columns(2)
@@ -451,7 +780,7 @@ def main():
                 st.session_state.line_bar_series = []
                 st.session_state.horizontal_bar_series = []
                 st.session_state.current_visualization = None
-                st.experimental_rerun()
+                st.rerun()
             
     except Exception as e:
         st.error(f"Error: {str(e)}")